@@ -4,10 +4,20 @@ Flask Web Application for MVG Bus Departure Checker
 Displays bus departures from line 180 at Olympiazentrum station in direction Berduxstraße.
 """
 
-from flask import Flask, render_template, jsonify
+from flask import Flask, render_template, jsonify, request, g
 from datetime import datetime
-from mvg import MvgApi
-from mvg.mvgapi import MvgApiError
+import atexit
+import cProfile
+import hashlib
+import hmac
+import marshal
+import os
+import pstats
+import random
+import threading
+import time
+
+import snapshot
 
 app = Flask(__name__)
 
@@ -16,6 +26,50 @@ DEPARTURE_LIMIT = 50
 STATION_NAME = "Olympiazentrum"
 LINE_NUMBER = "180"
 DIRECTION = "Berduxstraße"
+FETCH_RETRY_DELAY = 5  # Seconds a failed synchronous fetch is not retried
+
+# MVG API class used for fetching; None means mvg.MvgApi, imported on first fetch
+MvgApi = None
+
+# Stubbed MVG upstream for load testing, see load_test.py
+if os.environ.get('MVG_STUB_UPSTREAM', 'False').lower() == 'true':
+    from stub_upstream import StubMvgApi as MvgApi
+
+# Last fetched departure snapshot, loaded from disk so a fresh worker can answer immediately
+_snapshot = snapshot.load_snapshot(STATION_NAME)
+_snapshot_lock = threading.Lock()
+_refreshing = False
+_fetch_lock = threading.Lock()
+_last_fetch_error = None
+
+# Profiling configuration (all opt-in via environment variables)
+PROFILE_ENABLED = os.environ.get('MVG_PROFILE', 'False').lower() == 'true'
+PROFILE_SECRET = os.environ.get('MVG_PROFILE_SECRET', '')
+PROFILE_DIR = os.environ.get('MVG_PROFILE_DIR', 'profiles')
+PROFILE_DUMP_INTERVAL = 30  # Seconds between background dumps of the aggregate
+PROFILE_SIGNATURE_MAX_AGE = 300  # Seconds a signed profiling header stays valid
+PROFILE_HEADER = "X-MVG-Profile"
+
+
+def _parse_sample_rate(value):
+    """Parse the profiling sample rate, clamped to [0, 1]; invalid values disable sampling."""
+    try:
+        rate = float(value)
+    except ValueError:
+        return 0.0
+    if rate != rate:  # NaN
+        return 0.0
+    return min(1.0, max(0.0, rate))
+
+
+PROFILE_SAMPLE_RATE = _parse_sample_rate(os.environ.get('MVG_PROFILE_SAMPLE_RATE', '1.0'))
+
+_profile_lock = threading.Lock()
+_profile_stats = None
+_profile_dirty = False
+_profile_dumper = None
+_profile_dump_requested = threading.Event()
+_profiler_active = threading.Lock()
 
 
 def format_departure_time(timestamp):
@@ -34,6 +88,84 @@ def format_departure_time(timestamp):
         return str(timestamp)
 
 
+def refresh_snapshot():
+    """
+    Fetch fresh data from the MVG API and store it as the current snapshot.
+
+    :return: New snapshot, or None if the station could not be found
+    :raises snapshot.UpstreamError: If the MVG API request fails
+    """
+    global _snapshot
+    fresh = snapshot.fetch_snapshot(STATION_NAME, DEPARTURE_LIMIT, MvgApi)
+    if fresh is not None:
+        _snapshot = fresh
+        snapshot.save_snapshot(fresh)
+    return fresh
+
+
+def _refresh_in_background():
+    """Refresh the snapshot, keeping the old one if the refresh fails."""
+    global _refreshing
+    try:
+        refresh_snapshot()
+    except Exception:
+        app.logger.warning("Background refresh of the departure snapshot failed", exc_info=True)
+    finally:
+        with _snapshot_lock:
+            _refreshing = False
+
+
+def _fetch_snapshot_once():
+    """
+    Fetch a snapshot synchronously, letting only one request at a time hit the MVG API.
+
+    Requests waiting for the lock reuse the result of the fetch that ran before
+    them, and a failed fetch is reported to waiting requests for
+    FETCH_RETRY_DELAY seconds instead of being retried by each of them.
+
+    :return: Snapshot, or None if the station could not be found
+    """
+    global _last_fetch_error
+    with _fetch_lock:
+        current = _snapshot
+        if current is not None and not snapshot.is_expired(current):
+            return current
+        if _last_fetch_error is not None and time.time() - _last_fetch_error[0] < FETCH_RETRY_DELAY:
+            raise snapshot.UpstreamError(_last_fetch_error[1])
+        try:
+            fresh = refresh_snapshot()
+        except Exception as e:
+            _last_fetch_error = (time.time(), str(e))
+            raise
+        _last_fetch_error = None
+        return fresh
+
+
+def get_snapshot():
+    """
+    Return the current snapshot without blocking on the MVG API if possible.
+
+    A stale snapshot is returned immediately while a single background
+    refresh is started. Without a snapshot, or once it has expired, the
+    data is fetched synchronously so that outdated departures are never
+    shown as upcoming.
+
+    :return: Tuple of snapshot (None if the station could not be found) and stale flag
+    """
+    global _refreshing
+    current = _snapshot
+    if current is None or snapshot.is_expired(current):
+        return _fetch_snapshot_once(), False
+    if not snapshot.is_stale(current):
+        return current, False
+    with _snapshot_lock:
+        start_refresh = not _refreshing
+        _refreshing = True
+    if start_refresh:
+        threading.Thread(target=_refresh_in_background, daemon=True).start()
+    return current, True
+
+
 def get_departures_data():
     """
     Fetch departure data from MVG API.
@@ -41,23 +173,18 @@ def get_departures_data():
     :return: Dictionary with station info and departures
     """
     try:
-        # Get station information
-        station_info = MvgApi.station(STATION_NAME)
-        if not station_info:
+        current, stale = get_snapshot()
+        if not current:
             return {
                 "error": f"Could not find station '{STATION_NAME}'",
                 "station_name": STATION_NAME
             }
         
-        station_id = station_info.get("id")
-        
-        # Initialize MVG API and get departures
-        api = MvgApi(station_id)
-        departures = api.departures(limit=DEPARTURE_LIMIT)
+        station_info = current["station"]
         
         # Filter for line 180 in direction Berduxstraße
         filtered_departures = []
-        for departure in departures:
+        for departure in current["departures"]:
             if departure.get("line") == LINE_NUMBER and DIRECTION in departure.get("destination", ""):
                 filtered_departures.append({
                     "line": departure.get("line"),
@@ -72,15 +199,16 @@ def get_departures_data():
         
         return {
             "station_name": STATION_NAME,
-            "station_id": station_id,
+            "station_id": station_info.get("id"),
             "place": station_info.get("place"),
             "line_number": LINE_NUMBER,
             "direction": DIRECTION,
             "departures": filtered_departures,
-            "last_update": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            "last_update": datetime.fromtimestamp(current["fetched_at"]).strftime("%Y-%m-%d %H:%M:%S"),
+            "stale": stale
         }
     
-    except MvgApiError as e:
+    except snapshot.UpstreamError as e:
         return {
             "error": "Failed to retrieve data from MVG API. Please try again later.",
             "station_name": STATION_NAME
@@ -99,37 +227,33 @@ def get_raw_departures():
     :return: Dictionary with raw API response
     """
     try:
-        # Get station information
-        station_info = MvgApi.station(STATION_NAME)
-        if not station_info:
+        current, stale = get_snapshot()
+        if not current:
             return {
                 "error": f"Could not find station '{STATION_NAME}'",
                 "station_name": STATION_NAME
             }
         
-        station_id = station_info.get("id")
-        
-        # Initialize MVG API and get departures
-        api = MvgApi(station_id)
-        all_departures = api.departures(limit=DEPARTURE_LIMIT)
+        station_info = current["station"]
         
         # Filter for line 180 in direction Berduxstraße
         filtered_departures = []
-        for departure in all_departures:
+        for departure in current["departures"]:
             if departure.get("line") == LINE_NUMBER and DIRECTION in departure.get("destination", ""):
                 filtered_departures.append(departure)
         
         return {
             "station_name": STATION_NAME,
-            "station_id": station_id,
+            "station_id": station_info.get("id"),
             "place": station_info.get("place"),
             "line_number": LINE_NUMBER,
             "direction": DIRECTION,
             "departures": filtered_departures,
-            "last_update_timestamp": int(datetime.now().timestamp())
+            "last_update_timestamp": int(current["fetched_at"]),
+            "stale": stale
         }
     
-    except MvgApiError as e:
+    except snapshot.UpstreamError as e:
         return {
             "error": "Failed to retrieve data from MVG API. Please try again later.",
             "station_name": STATION_NAME
@@ -141,6 +265,142 @@ def get_raw_departures():
         }
 
 
+def verify_profile_signature(header_value):
+    """
+    Check a signed profiling header of the form "<timestamp>:<signature>".
+
+    The signature must be the hex HMAC-SHA256 of "<path>|<timestamp>", keyed
+    with MVG_PROFILE_SECRET, and the timestamp must be within
+    PROFILE_SIGNATURE_MAX_AGE seconds of the current time.
+
+    :param header_value: Value of the profiling header
+    :return: True if the signature is valid and recent
+    """
+    if not PROFILE_SECRET:
+        return False
+    timestamp, _, signature = header_value.partition(":")
+    try:
+        signed_at = int(timestamp)
+    except ValueError:
+        return False
+    if abs(time.time() - signed_at) > PROFILE_SIGNATURE_MAX_AGE:
+        return False
+    message = f"{request.path}|{timestamp}".encode("utf-8")
+    expected = hmac.new(PROFILE_SECRET.encode("utf-8"), message, hashlib.sha256).hexdigest()
+    # Compare bytes, since compare_digest rejects non-ASCII strings
+    return hmac.compare_digest(signature.encode("utf-8"), expected.encode("ascii"))
+
+
+def is_signed_profile_request():
+    """
+    Check whether the current request carries a valid signed profiling header.
+
+    :return: True if profiling was requested with a valid signature
+    """
+    header_value = request.headers.get(PROFILE_HEADER)
+    return bool(header_value) and verify_profile_signature(header_value)
+
+
+def dump_profile_stats():
+    """
+    Write the aggregated stats of this process to disk.
+
+    The aggregate is written atomically in pstats format to
+    PROFILE_DIR/aggregate.<pid>.prof and can be opened with pstats, snakeviz
+    or converted for speedscope.
+    """
+    global _profile_dirty
+    with _profile_lock:
+        if _profile_stats is None or not _profile_dirty:
+            return
+        # Entries are replaced, not mutated, when profiles are merged, so a shallow copy is enough
+        stats = dict(_profile_stats.stats)
+        _profile_dirty = False
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"aggregate.{os.getpid()}.prof")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        marshal.dump(stats, f)
+    os.replace(tmp_path, path)
+
+
+def _dump_profiles_periodically():
+    """Dump the aggregated stats every PROFILE_DUMP_INTERVAL seconds or when requested."""
+    while True:
+        _profile_dump_requested.wait(PROFILE_DUMP_INTERVAL)
+        _profile_dump_requested.clear()
+        try:
+            dump_profile_stats()
+        except Exception:
+            app.logger.warning("Writing the profile aggregate failed", exc_info=True)
+
+
+def save_profile(profiler, dump_now=False):
+    """
+    Merge a finished request profile into the aggregated stats in memory.
+
+    The aggregate is written by a background thread every PROFILE_DUMP_INTERVAL
+    seconds, right away if dump_now is set, and when the process exits.
+
+    :param profiler: Disabled cProfile.Profile instance of the request
+    :param dump_now: Write the aggregate as soon as possible
+    """
+    global _profile_stats, _profile_dirty, _profile_dumper
+    with _profile_lock:
+        if _profile_stats is None:
+            _profile_stats = pstats.Stats(profiler)
+        else:
+            _profile_stats.add(profiler)
+        _profile_dirty = True
+        if _profile_dumper is None:
+            # Started lazily so that it runs in each forked worker process
+            _profile_dumper = threading.Thread(target=_dump_profiles_periodically, daemon=True)
+            _profile_dumper.start()
+    if dump_now:
+        _profile_dump_requested.set()
+
+
+atexit.register(dump_profile_stats)
+
+
+@app.before_request
+def start_profiling():
+    """
+    Start a profiler for the request if profiling is requested.
+
+    Only one request per process is profiled at a time; concurrent requests
+    are not profiled, so the effective sample rate drops under concurrency.
+    On Python 3.12+ cProfile records all threads, so the profile also
+    contains work done concurrently by other requests and background threads.
+    """
+    signed = is_signed_profile_request()
+    if not signed and not (PROFILE_ENABLED and random.random() < PROFILE_SAMPLE_RATE):
+        return
+    if not _profiler_active.acquire(blocking=False):
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiling tool is already active in this interpreter
+        _profiler_active.release()
+        return
+    g.profiler = profiler
+    g.profile_signed = signed
+
+
+@app.teardown_request
+def stop_profiling(exc):
+    """Stop the request profiler, if any, and store its results."""
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        try:
+            profiler.disable()
+        finally:
+            _profiler_active.release()
+        save_profile(profiler, dump_now=g.pop("profile_signed", False))
+
+
 @app.route('/')
 def index():
     """Render the main page with departure information."""
@@ -163,7 +423,6 @@ def raw_departures():
 
 
 if __name__ == '__main__':
-    import os
     # Only enable debug mode if explicitly set in environment variable
     debug_mode = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
     app.run(debug=debug_mode, host='0.0.0.0', port=5000)
@@ -5,10 +5,10 @@ Generates a static HTML page for GitHub Pages deployment.
 """
 
 from datetime import datetime
-from mvg import MvgApi
-from mvg.mvgapi import MvgApiError
 import os
 
+import snapshot
+
 # Configuration constants
 DEPARTURE_LIMIT = 50
 STATION_NAME = "Olympiazentrum"
@@ -27,56 +27,87 @@ def format_departure_time(timestamp):
         return str(timestamp)
 
 
-def generate_static_html():
-    """Generate static HTML page with current departure data."""
+def get_departure_snapshot():
+    """
+    Return departure data, fetching fresh data unless the stored snapshot is recent.
+    Falls back to the stored snapshot if the MVG API cannot be reached and the
+    snapshot has not expired yet.
+    
+    :return: Tuple of snapshot (None if unavailable), stale flag and error message (None on success)
+    """
+    departure_snapshot = snapshot.load_snapshot(STATION_NAME)
+    if departure_snapshot is not None and not snapshot.is_stale(departure_snapshot):
+        return departure_snapshot, False, None
     
-    # Fetch data
     try:
-        station_info = MvgApi.station(STATION_NAME)
-        if not station_info:
-            error_msg = f"Could not find station '{STATION_NAME}'"
-            return generate_error_page(error_msg)
-        
-        station_id = station_info.get("id")
-        api = MvgApi(station_id)
-        departures = api.departures(limit=DEPARTURE_LIMIT)
+        fresh_snapshot = snapshot.fetch_snapshot(STATION_NAME, DEPARTURE_LIMIT)
+        if not fresh_snapshot:
+            return None, False, f"Could not find station '{STATION_NAME}'"
+        snapshot.save_snapshot(fresh_snapshot)
+        return fresh_snapshot, False, None
+    except snapshot.UpstreamError as e:
+        error_msg = f"Failed to retrieve data from MVG API: {e}"
+    except Exception as e:
+        error_msg = f"An unexpected error occurred: {e}"
+    
+    if departure_snapshot is not None and not snapshot.is_expired(departure_snapshot):
+        print(f"Warning: {error_msg}. Using stored departure snapshot.")
+        return departure_snapshot, True, None
+    return None, False, error_msg
+
+
+def filter_departures(departures):
+    """Return the departures of the configured line in the configured direction."""
+    return [
+        departure for departure in departures
+        if departure.get("line") == LINE_NUMBER and DIRECTION in departure.get("destination", "")
+    ]
+
+
+def generate_static_html(departure_snapshot, stale=False):
+    """Generate static HTML page from departure snapshot data."""
+    
+    try:
+        station_info = departure_snapshot["station"]
         
-        # Filter departures
+        # Format departures
         filtered_departures = []
-        for departure in departures:
-            if departure.get("line") == LINE_NUMBER and DIRECTION in departure.get("destination", ""):
-                filtered_departures.append({
-                    "line": departure.get("line"),
-                    "type": departure.get("type", "Unknown"),
-                    "destination": departure.get("destination", "Unknown"),
-                    "time": format_departure_time(departure.get("time")),
-                    "delay": departure.get("delay", 0),
-                    "platform": departure.get("platform"),
-                    "cancelled": departure.get("cancelled", False)
-                })
+        for departure in filter_departures(departure_snapshot["departures"]):
+            filtered_departures.append({
+                "line": departure.get("line"),
+                "type": departure.get("type", "Unknown"),
+                "destination": departure.get("destination", "Unknown"),
+                "time": format_departure_time(departure.get("time")),
+                "delay": departure.get("delay", 0),
+                "platform": departure.get("platform"),
+                "cancelled": departure.get("cancelled", False)
+            })
         
         # Generate HTML
         html = generate_html_page(
             station_name=STATION_NAME,
-            station_id=station_id,
+            station_id=station_info.get("id"),
             place=station_info.get("place"),
             line_number=LINE_NUMBER,
             direction=DIRECTION,
             departures=filtered_departures,
-            last_update=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            last_update=format_departure_time(departure_snapshot["fetched_at"]),
+            stale=stale
         )
         
         return html
         
-    except MvgApiError as e:
-        return generate_error_page(f"Failed to retrieve data from MVG API: {e}")
     except Exception as e:
         return generate_error_page(f"An unexpected error occurred: {e}")
 
 
-def generate_html_page(station_name, station_id, place, line_number, direction, departures, last_update):
+def generate_html_page(station_name, station_id, place, line_number, direction, departures, last_update, stale=False):
     """Generate the HTML page with departure data."""
     
+    stale_html = ""
+    if stale:
+        stale_html = '<div style="margin-top: 10px; color: #856404; font-weight: bold;">⚠️ The MVG API could not be reached. This data may be outdated.</div>'
+    
     departures_html = ""
     if departures:
         for dep in departures:
@@ -340,6 +371,7 @@ def generate_html_page(station_name, station_id, place, line_number, direction,
             
             <div class="last-update">
                 Last updated: {last_update}
+                {stale_html}
                 <br>
                 <div style="margin-top: 15px; padding: 15px; background: #f8f9fa; border-radius: 10px; font-size: 0.9em; color: #666;">
                     <strong>ℹ️ About Updates:</strong><br>
@@ -402,7 +434,11 @@ def generate_error_page(error_msg):
 
 
 if __name__ == "__main__":
-    html_content = generate_static_html()
+    departure_snapshot, stale, error_msg = get_departure_snapshot()
+    if departure_snapshot is None:
+        html_content = generate_error_page(error_msg)
+    else:
+        html_content = generate_static_html(departure_snapshot, stale)
     
     # Create docs directory for GitHub Pages
     os.makedirs("docs", exist_ok=True)
@@ -413,29 +449,20 @@ if __name__ == "__main__":
     
     print("Static site generated successfully in docs/index.html")
     
-    # Generate raw JSON data for iOS Shortcuts
+    # Generate raw JSON data for iOS Shortcuts from the same snapshot
     try:
         import json
-        station_info = MvgApi.station(STATION_NAME)
-        if station_info:
-            station_id = station_info.get("id")
-            api = MvgApi(station_id)
-            all_departures = api.departures(limit=DEPARTURE_LIMIT)
-            
-            # Filter for line 180 in direction Berduxstraße
-            filtered_departures = []
-            for departure in all_departures:
-                if departure.get("line") == LINE_NUMBER and DIRECTION in departure.get("destination", ""):
-                    filtered_departures.append(departure)
-            
+        if departure_snapshot is not None:
+            station_info = departure_snapshot["station"]
             raw_data = {
                 "station_name": STATION_NAME,
-                "station_id": station_id,
+                "station_id": station_info.get("id"),
                 "place": station_info.get("place"),
                 "line_number": LINE_NUMBER,
                 "direction": DIRECTION,
-                "departures": filtered_departures,
-                "last_update_timestamp": int(datetime.now().timestamp())
+                "departures": filter_departures(departure_snapshot["departures"]),
+                "last_update_timestamp": int(departure_snapshot["fetched_at"]),
+                "stale": stale
             }
             
             # Write to raw.json
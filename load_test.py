@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Load Generator for MVG Bus Departure Checker
+Drives the Flask endpoints against a stubbed MVG upstream and reports
+throughput, latency percentiles and upstream-call amplification.
+"""
+
+import argparse
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from stub_upstream import DEFAULT_UPSTREAM_LATENCY, count_upstream_calls
+
+# Configuration constants
+DEFAULT_ENDPOINTS = ["/", "/api/departures", "/raw"]
+DEFAULT_CONCURRENCY = 10
+DEFAULT_DURATION = 10.0  # Seconds
+DEFAULT_SNAPSHOT_MAX_AGE = 30  # Seconds
+DEFAULT_TIMEOUT = 5.0  # Seconds per HTTP request
+LOCALHOST_PORT = 5001
+SERVER_START_TIMEOUT = 15  # Seconds to wait for the server subprocess
+
+
+def percentile(sorted_values, fraction):
+    """
+    Return the given percentile of an already sorted list.
+
+    :param sorted_values: Sorted list of numbers
+    :param fraction: Percentile as a fraction between 0 and 1
+    :return: Percentile value, or 0.0 for an empty list
+    """
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def make_in_process_client():
+    """Return a request function that calls the app through Flask's test client."""
+    import app as mvg_web
+
+    local = threading.local()
+
+    def do_request(path):
+        # The test client is not safe to share between threads, so use one per worker
+        if not hasattr(local, "client"):
+            local.client = mvg_web.app.test_client()
+        return local.client.get(path).status_code
+
+    return do_request
+
+
+def make_http_client(base_url, timeout):
+    """
+    Return a request function that calls the app over HTTP.
+
+    Timeouts raise and are therefore recorded as errors by run_load().
+
+    :param base_url: URL of the server without trailing slash
+    :param timeout: Seconds to wait for each response
+    """
+    def do_request(path):
+        try:
+            with urllib.request.urlopen(base_url + path, timeout=timeout) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    return do_request
+
+
+def start_server(command, port, env, calls_file):
+    """
+    Start the app in a separate process and wait until it serves stubbed data.
+
+    The server counts as ready once a request succeeds and the stub has recorded
+    upstream calls, which rules out answers from another server on the same port.
+
+    :param command: Server command line with a {port} placeholder, or None for
+        the Flask development server
+    :param port: Port the server listens on
+    :param env: Environment for the server process
+    :param calls_file: Stub upstream calls file the server writes to
+    :return: Server process
+    """
+    if command:
+        args = shlex.split(command.format(port=port))
+    else:
+        args = [sys.executable, "-m", "flask", "--app", "app", "run",
+                "--host", "127.0.0.1", "--port", str(port), "--with-threads"]
+    process = subprocess.Popen(args, env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/raw", timeout=1).close()
+            if count_upstream_calls(calls_file) > 0:
+                return process
+        except OSError:
+            pass
+        time.sleep(0.1)
+    process.terminate()
+    process.wait()
+    raise RuntimeError(f"Server with stubbed upstream did not answer on port {port} in time")
+
+
+def run_load(do_request, endpoints, concurrency, duration, rate):
+    """
+    Drive the endpoints with a fixed number of workers.
+
+    With a target rate, each request is timed from its scheduled send time,
+    so waiting caused by an overloaded server counts towards its latency.
+
+    :param do_request: Function performing a GET for a path and returning the status code
+    :param endpoints: List of paths to cycle through
+    :param concurrency: Number of concurrent workers
+    :param duration: Test duration in seconds
+    :param rate: Total target requests per second, or None for unthrottled
+    :return: Dictionary mapping endpoint to list of (latency, status) tuples
+    """
+    results = {endpoint: [] for endpoint in endpoints}
+    results_lock = threading.Lock()
+    interval = concurrency / rate if rate else 0.0
+    deadline = time.perf_counter() + duration
+
+    def worker(offset):
+        next_start = time.perf_counter() + interval * offset / concurrency
+        count = offset
+        while time.perf_counter() < deadline:
+            if interval:
+                delay = next_start - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                start = next_start
+                next_start += interval
+            else:
+                start = time.perf_counter()
+            endpoint = endpoints[count % len(endpoints)]
+            count += 1
+            try:
+                status = do_request(endpoint)
+            except Exception:
+                status = None
+            elapsed = time.perf_counter() - start
+            with results_lock:
+                results[endpoint].append((elapsed, status))
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def print_report(results, elapsed, upstream_calls, rate):
+    """Print throughput, latency percentiles and upstream amplification."""
+    total_requests = sum(len(samples) for samples in results.values())
+    print(f"{'Endpoint':<18}{'Requests':>10}{'Errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    print("-" * 66)
+    for endpoint, samples in results.items():
+        latencies = sorted(latency for latency, _ in samples)
+        errors = sum(1 for _, status in samples if status != 200)
+        print(f"{endpoint:<18}{len(samples):>10}{errors:>8}"
+              f"{percentile(latencies, 0.50) * 1000:>10.1f}"
+              f"{percentile(latencies, 0.95) * 1000:>10.1f}"
+              f"{percentile(latencies, 0.99) * 1000:>10.1f}")
+    print("-" * 66)
+    throughput = total_requests / elapsed if elapsed else 0.0
+    target = f"{rate:.1f} req/s" if rate else "unthrottled"
+    print(f"Total requests: {total_requests} in {elapsed:.1f}s "
+          f"({throughput:.1f} req/s achieved, target {target})")
+    amplification = upstream_calls / total_requests if total_requests else 0.0
+    print(f"Upstream MVG calls: {upstream_calls} ({amplification:.2f} per request)")
+
+
+def main():
+    """Parse arguments, run the load test and print the report."""
+    parser = argparse.ArgumentParser(description="Load test the MVG web endpoints against a stubbed upstream.")
+    parser.add_argument("--mode", choices=["in-process", "localhost"], default="in-process",
+                        help="call the app through the test client or over HTTP on a server subprocess")
+    parser.add_argument("--endpoints", nargs="+", default=DEFAULT_ENDPOINTS, help="paths to request")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="number of concurrent workers")
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION, help="test duration in seconds")
+    parser.add_argument("--rate", type=float, default=None, help="total target requests per second (default: unthrottled)")
+    parser.add_argument("--upstream-latency", type=float, default=DEFAULT_UPSTREAM_LATENCY,
+                        help="simulated latency of each MVG API call in seconds")
+    parser.add_argument("--snapshot-max-age", type=int, default=DEFAULT_SNAPSHOT_MAX_AGE,
+                        help="seconds before the app refreshes its departure snapshot")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT,
+                        help="seconds to wait for each response in localhost mode")
+    parser.add_argument("--port", type=int, default=LOCALHOST_PORT, help="port for localhost mode")
+    parser.add_argument("--server-command", default=None,
+                        help="command starting the server in localhost mode with a {port} placeholder, e.g. "
+                             "'gunicorn -w 4 -b 127.0.0.1:{port} app:app' (default: Flask development server)")
+    args = parser.parse_args()
+    if args.server_command and "{port}" not in args.server_command:
+        parser.error("--server-command must contain a {port} placeholder")
+
+    # Configure the app to use the stubbed upstream and a throwaway snapshot file
+    work_dir = tempfile.mkdtemp()
+    calls_file = os.path.join(work_dir, "upstream_calls")
+    os.environ.update({
+        "MVG_STUB_UPSTREAM": "true",
+        "MVG_STUB_LATENCY": str(args.upstream_latency),
+        "MVG_STUB_CALLS_FILE": calls_file,
+        "MVG_SNAPSHOT_PATH": os.path.join(work_dir, "snapshot.bin"),
+        "MVG_SNAPSHOT_MAX_AGE": str(args.snapshot_max_age),
+    })
+
+    server = None
+    try:
+        if args.mode == "localhost":
+            server = start_server(args.server_command, args.port, os.environ.copy(), calls_file)
+            do_request = make_http_client(f"http://127.0.0.1:{args.port}", args.timeout)
+        else:
+            do_request = make_in_process_client()
+
+        # Upstream calls made while waiting for the server are not part of the test
+        baseline_calls = count_upstream_calls(calls_file)
+        print(f"Running {args.mode} load test: {args.concurrency} workers, {args.duration:.0f}s, "
+              f"rate {args.rate if args.rate else 'unthrottled'}")
+        start = time.perf_counter()
+        results = run_load(do_request, args.endpoints, args.concurrency, args.duration, args.rate)
+        elapsed = time.perf_counter() - start
+        upstream_calls = count_upstream_calls(calls_file) - baseline_calls
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_report(results, elapsed, upstream_calls, args.rate)
+
+if __name__ == "__main__":
+    main()
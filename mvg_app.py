@@ -6,8 +6,8 @@ in direction Berduxstraße using the MVG API.
 """
 
 from datetime import datetime
-from mvg import MvgApi
-from mvg.mvgapi import MvgApiError
+
+import snapshot
 
 # Configuration constants
 DEPARTURE_LIMIT = 50  # Maximum number of departures to fetch
@@ -37,31 +37,37 @@ def main():
     
     print(f"Checking station ID for: {station_name}")
     
-    try:
-        # Get the station information
-        station_info = MvgApi.station(station_name)
-        if not station_info:
-            print(f"Error: Could not find station '{station_name}'")
-            print("Please verify the station name and try again.")
-            return
-        
-        station_id = station_info.get("id")
-        print(f"Station ID for {station_name}: {station_id}")
-        print(f"Place: {station_info.get('place')}")
-        
-        # Initialize the MVG API with the station ID
-        api = MvgApi(station_id)
-        
-        # Get all departures for the station
-        print(f"\nFetching departures from {station_name}...")
-        departures = api.departures(limit=DEPARTURE_LIMIT)
-    except MvgApiError as e:
-        print(f"Error: Failed to retrieve data from MVG API: {e}")
-        print("Please check your internet connection and try again.")
-        return
-    except Exception as e:
-        print(f"Error: An unexpected error occurred: {e}")
-        return
+    # Use the stored snapshot if it is recent enough, otherwise fetch fresh data
+    departure_snapshot = snapshot.load_snapshot(station_name)
+    if departure_snapshot is None or snapshot.is_stale(departure_snapshot):
+        try:
+            print(f"Fetching departures from {station_name}...")
+            fresh_snapshot = snapshot.fetch_snapshot(station_name, DEPARTURE_LIMIT)
+            if not fresh_snapshot:
+                print(f"Error: Could not find station '{station_name}'")
+                print("Please verify the station name and try again.")
+                return
+            departure_snapshot = fresh_snapshot
+            snapshot.save_snapshot(departure_snapshot)
+        except snapshot.UpstreamError as e:
+            if departure_snapshot is None or snapshot.is_expired(departure_snapshot):
+                print(f"Error: Failed to retrieve data from MVG API: {e}")
+                print("Please check your internet connection and try again.")
+                return
+            print(f"Warning: Failed to retrieve data from MVG API: {e}")
+            print("Showing stored departures, which may be outdated.")
+        except Exception as e:
+            if departure_snapshot is None or snapshot.is_expired(departure_snapshot):
+                print(f"Error: An unexpected error occurred: {e}")
+                return
+            print(f"Warning: An unexpected error occurred: {e}")
+            print("Showing stored departures, which may be outdated.")
+    
+    station_info = departure_snapshot["station"]
+    departures = departure_snapshot["departures"]
+    print(f"Station ID for {station_name}: {station_info.get('id')}")
+    print(f"Place: {station_info.get('place')}")
+    print(f"Data fetched at: {format_departure_time(departure_snapshot['fetched_at'])}")
     
     # Filter for line 180 in direction Berduxstraße
     line_number = "180"
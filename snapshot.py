@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Departure Snapshot Storage for MVG Bus Departure Checker
+Persists the last fetched station and departure data to disk so that fresh
+processes can answer immediately instead of waiting for the MVG API.
+"""
+
+import marshal
+import os
+import threading
+import time
+
+def _parse_seconds(name, default):
+    """Read a number of seconds from the environment, falling back to the default on invalid values."""
+    try:
+        return max(0, int(os.environ.get(name, default)))
+    except ValueError:
+        return default
+
+
+# Configuration constants
+SNAPSHOT_PATH = os.environ.get(
+    'MVG_SNAPSHOT_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '.mvg_snapshot.bin')
+)
+SNAPSHOT_MAX_AGE = _parse_seconds('MVG_SNAPSHOT_MAX_AGE', 30)  # Seconds before refreshing
+SNAPSHOT_EXPIRY = _parse_seconds('MVG_SNAPSHOT_EXPIRY', 900)  # Seconds before data is unusable
+SNAPSHOT_VERSION = 1
+
+
+class UpstreamError(Exception):
+    """Raised when departure data could not be retrieved from the MVG API."""
+
+
+def fetch_snapshot(station_name, limit, api_class=None, api_error=None):
+    """
+    Fetch station information and departures from the MVG API.
+
+    The mvg package is imported only when no API class is given, so processes
+    that can be served from a stored snapshot never pay for importing it.
+
+    :param station_name: Name of the station to look up
+    :param limit: Maximum number of departures to fetch
+    :param api_class: MVG API class to use, defaults to mvg.MvgApi
+    :param api_error: Exception type(s) of api_class to report as UpstreamError;
+        defaults to mvg's MvgApiError without api_class, otherwise to any Exception
+    :return: Snapshot dictionary, or None if the station could not be found
+    :raises UpstreamError: If the MVG API request fails
+    """
+    if api_class is None:
+        from mvg import MvgApi as api_class
+        from mvg.mvgapi import MvgApiError as api_error
+    elif api_error is None:
+        api_error = Exception
+
+    try:
+        station_info = api_class.station(station_name)
+        if not station_info:
+            return None
+        departures = api_class(station_info.get("id")).departures(limit=limit)
+    except api_error as e:
+        raise UpstreamError(str(e)) from e
+
+    return {
+        "version": SNAPSHOT_VERSION,
+        "station_name": station_name,
+        "station": station_info,
+        "departures": departures,
+        "fetched_at": time.time()
+    }
+
+
+def load_snapshot(station_name, path=None):
+    """
+    Load a snapshot from disk.
+
+    :param station_name: Station the snapshot must have been fetched for
+    :param path: Snapshot file path, defaults to SNAPSHOT_PATH
+    :return: Snapshot dictionary, or None if missing, unreadable or for another station
+    """
+    if path is None:
+        path = SNAPSHOT_PATH
+    try:
+        with open(path, "rb") as f:
+            snapshot = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get("version") != SNAPSHOT_VERSION:
+        return None
+    if snapshot.get("station_name") != station_name:
+        return None
+    return snapshot
+
+
+def save_snapshot(snapshot, path=None):
+    """
+    Write a snapshot to disk atomically. Failures are ignored since the
+    snapshot is only an optimization.
+
+    :param snapshot: Snapshot dictionary as returned by fetch_snapshot()
+    :param path: Snapshot file path, defaults to SNAPSHOT_PATH
+    """
+    if path is None:
+        path = SNAPSHOT_PATH
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            marshal.dump(snapshot, f)
+        os.replace(tmp_path, path)
+    except (OSError, ValueError):
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def is_stale(snapshot, max_age=None):
+    """
+    Check whether a snapshot is older than the allowed age.
+
+    :param snapshot: Snapshot dictionary
+    :param max_age: Maximum age in seconds, defaults to SNAPSHOT_MAX_AGE
+    :return: True if the snapshot should be refreshed
+    """
+    if max_age is None:
+        max_age = SNAPSHOT_MAX_AGE
+    return time.time() - snapshot.get("fetched_at", 0) > max_age
+
+
+def is_expired(snapshot):
+    """
+    Check whether a snapshot is too old to be shown at all, even as stale data.
+
+    :param snapshot: Snapshot dictionary
+    :return: True if the snapshot must not be used
+    """
+    return is_stale(snapshot, SNAPSHOT_EXPIRY)
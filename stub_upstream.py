@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Stubbed MVG Upstream for MVG Bus Departure Checker
+Provides a stand-in for the MVG API used by load_test.py. app.py installs
+it when the MVG_STUB_UPSTREAM environment variable is set.
+"""
+
+import os
+import time
+from datetime import datetime
+
+# Configuration constants
+DEFAULT_UPSTREAM_LATENCY = 0.05  # Seconds per stubbed MVG API call
+LINE_NUMBER = "180"
+DIRECTION = "Berduxstraße"
+
+
+class StubMvgApi:
+    """
+    Stand-in for mvg.MvgApi that returns canned data and counts upstream calls.
+
+    app.py installs it when MVG_STUB_UPSTREAM is set. Calls are counted by
+    appending one byte per call to MVG_STUB_CALLS_FILE, so the count also
+    covers server subprocesses and multiple workers.
+    """
+
+    latency = float(os.environ.get('MVG_STUB_LATENCY', DEFAULT_UPSTREAM_LATENCY))
+    calls_file = os.environ.get('MVG_STUB_CALLS_FILE')
+
+    def __init__(self, station_id):
+        self.station_id = station_id
+
+    @classmethod
+    def _record_call(cls):
+        if cls.calls_file:
+            with open(cls.calls_file, "ab") as f:
+                f.write(b".")
+        time.sleep(cls.latency)
+
+    @classmethod
+    def station(cls, query):
+        """Return a fixed station for any query."""
+        cls._record_call()
+        return {"id": "de:09162:350", "name": query, "place": "München"}
+
+    def departures(self, limit=10):
+        """Return a mix of matching and non-matching departures."""
+        self._record_call()
+        now = int(datetime.now().timestamp())
+        departures = []
+        for i in range(limit):
+            matching = i % 3 == 0
+            departures.append({
+                "time": now + i * 120,
+                "planned": now + i * 120,
+                "line": LINE_NUMBER if matching else "173",
+                "destination": DIRECTION if matching else "Harthof",
+                "type": "Bus",
+                "icon": "mdi:bus",
+                "cancelled": False,
+                "messages": [],
+                "delay": i % 5,
+                "platform": None,
+            })
+        return departures
+
+
+def count_upstream_calls(calls_file):
+    """Return the number of stubbed upstream calls recorded in the calls file."""
+    try:
+        return os.path.getsize(calls_file)
+    except OSError:
+        return 0